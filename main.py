@@ -1,14 +1,21 @@
 import os
-import sys
-import subprocess
+import asyncio
+import collections
+import functools
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import time
+import random
+import shutil
+import httplib2
+import orjson
 from google import genai
 from pyrogram import Client
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 
 # --- Environment Variables ---
@@ -25,11 +32,74 @@ YT_REFRESH_TOKEN = os.environ.get("YOUTUBE_REFRESH_TOKEN")
 
 TG_POST_LINKS_ENV = os.environ.get("TG_POST_LINKS") # Supports multiple links
 
+# Resumable upload chunk size in MB; 0 sends the whole file in one request (fewest round trips, no mid-file resume).
+# Parsed in main(), so a malformed value gets a clear message instead of an import-time traceback
+YT_UPLOAD_CHUNK_MB_ENV = os.environ.get("YOUTUBE_UPLOAD_CHUNK_MB")
+
+# Without these the run can only fail, so check them once before any download starts
+REQUIRED_ENV_VARS = (
+    "TELEGRAM_API_ID", "TELEGRAM_API_HASH", "TG_BOT_TOKEN",
+    "YOUTUBE_CLIENT_ID", "YOUTUBE_CLIENT_SECRETS", "YOUTUBE_REFRESH_TOKEN",
+)
+
+# TMDB fields that are actually useful to Gemini; the rest (poster paths, genre ids, ...) only bloat the prompt
+GEMINI_METADATA_KEYS = (
+    "title", "name", "original_title", "original_name", "media_type",
+    "overview", "release_date", "first_air_date", "original_language", "vote_average",
+)
+
+# Telegram serves files in fixed 1 MB chunks; a download is split into this many
+# chunk ranges that are streamed concurrently over the single bot client
+TG_CHUNK_SIZE = 1024 * 1024
+TG_DOWNLOAD_WORKERS = 4
+# Pyrogram ends a range stream early (instead of raising) on FloodWait or network errors; a short
+# range is resumed from its next chunk after a backoff that every range honours. The limit counts
+# consecutive resumes that made no progress
+MAX_RANGE_RETRIES = 5
+DOWNLOAD_DIR = "downloads"
+
+# Links are processed concurrently: while one video uploads, the next one downloads and remuxes
+MAX_CONCURRENT_LINKS = 2
+
+# Subtitle tracks with fewer cues than this (e.g. songs-only tracks) are not worth a caption upload
+MIN_SUBTITLE_CUES = 3
+
+# Transient upload failures worth retrying (Google's resumable upload guidance)
+RETRIABLE_STATUS_CODES = (500, 502, 503, 504)
+RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, OSError)
+MAX_UPLOAD_RETRIES = 5
+
 # Global dictionary to track log throttling
 last_print_time = {}
 
+# Precompiled patterns used on every filename / FFmpeg output line
+SEASON_EPISODE_RE = re.compile(r'(?<!\d)S(\d{1,2})E(\d{1,2})', re.IGNORECASE)
+FFMPEG_TIME_RE = re.compile(r"time=(\d{2}:\d{2}:\d{2})")
+TITLE_DELIMITERS_RE = re.compile(r'[._]+')
+# Leading release-group tags such as '[Group]' or '(Group)'
+TITLE_PREFIX_TAGS_RE = re.compile(r'^(?:\s*(?:\[[^\]]*\]|\([^)]*\)))+\s*')
+# Everything from the first episode tag, year or release tag onwards is not part of the title
+TITLE_CUTOFF_RE = re.compile(
+    r'(?<!\d)S\d{1,2}E\d{1,2}'
+    r'|(?<![a-z0-9])(?:(?:19|20)\d{2}|\d{3,4}p|bluray|brrip|web-?dl|webrip|hdrip|hdtv|x26[45]|hevc)(?![a-z0-9])',
+    re.IGNORECASE
+)
+
+# ISO 639 tags ffprobe reports for English tracks (region-tagged 'en-*' variants are matched separately)
+ENGLISH_LANGUAGE_TAGS = {"eng", "en"}
+
+# Picture-based subtitle formats cannot be converted to SRT and would make the FFmpeg run fail
+IMAGE_SUBTITLE_CODECS = {"hdmv_pgs_subtitle", "dvd_subtitle", "dvb_subtitle", "xsub"}
+
+# Playlist IDs already resolved this run, keyed by lower-cased series title
+playlist_cache = {}
+
 # --- Initialization ---
 gemini_client = genai.Client(api_key=GEMINI_API_KEY) if GEMINI_API_KEY else None
+# TMDB-only session (it carries the TMDB key) so repeated lookups reuse one keep-alive TLS connection
+tmdb_session = requests.Session()
+tmdb_session.params = {"api_key": TMDB_API_KEY}
+tmdb_session.mount("https://", HTTPAdapter(pool_maxsize=4, max_retries=Retry(total=3, backoff_factor=0.5)))
 
 def get_youtube_service():
     """Authenticates and returns the YouTube API service."""
@@ -45,31 +115,56 @@ def get_youtube_service():
 
 def extract_season_episode(filename):
     """Extracts Season and Episode numbers from the filename."""
-    match = re.search(r'[sS](\d{2})[eE](\d{2})', filename)
+    match = SEASON_EPISODE_RE.search(filename)
     if match:
-        return match.group(1), match.group(2)
+        return match.group(1).zfill(2), match.group(2).zfill(2)
     return None, None
 
+def clean_title_from_filename(filename):
+    """Turns a release filename like 'Show.Name.S01E02.1080p.WEB-DL.mkv' into a searchable title ('Show Name')."""
+    name = TITLE_DELIMITERS_RE.sub(' ', os.path.splitext(filename)[0])
+    name = TITLE_PREFIX_TAGS_RE.sub('', name) or name
+    # Search from index 1 so titles that start with a year ('2012', '1917') are kept
+    cutoff = TITLE_CUTOFF_RE.search(name, 1)
+    title = (name[:cutoff.start()] if cutoff else name).strip(' -([')
+    return title or name.strip()
+
+@functools.lru_cache(maxsize=128)
+def search_tmdb(clean_title):
+    """Returns the top TMDB multi-search hit for a title. Cached, since every episode of a series asks for the same title."""
+    url = "https://api.themoviedb.org/3/search/multi"
+    # Let requests percent-encode the title (handles '&', '#', non-ASCII) instead of formatting it into the URL
+    response = tmdb_session.get(url, params={"query": clean_title}, timeout=10)
+    # An error status (bad key, rate limit) must raise, or lru_cache would keep its result-less body as a miss
+    response.raise_for_status()
+    results = orjson.loads(response.content).get("results")
+    return results[0] if results else None
+
 def fetch_movie_metadata(title):
     """Fetches movie/series details from TMDB."""
-    clean_title = re.sub(r'[sS]\d{2}[eE]\d{2}.*', '', title).replace('.', ' ').strip()
+    clean_title = clean_title_from_filename(title)
     print(f"[Metadata] Fetching TMDB details for: '{clean_title}'", flush=True)
-    url = f"https://api.themoviedb.org/3/search/multi?api_key={TMDB_API_KEY}&query={clean_title}"
     try:
-        response = requests.get(url).json()
-        if response.get("results"):
-            return response["results"][0], clean_title 
+        # Errors propagate out of search_tmdb, so a failed lookup is never cached
+        return search_tmdb(clean_title), clean_title
     except Exception as e:
         print(f"[Metadata] Error fetching TMDB data: {e}", flush=True)
     return None, clean_title
 
+def build_youtube_details(filename, season, episode):
+    """Runs the TMDB lookup and Gemini generation for a file. Returns (yt_details, series_name)."""
+    raw_meta, series_name = fetch_movie_metadata(filename)
+    return generate_youtube_details(raw_meta, series_name, season, episode), series_name
+
 def generate_youtube_details(raw_metadata, series_name, season, episode):
     """Uses Gemini to generate fancy, emoji-free YouTube titles and descriptions."""
     print("[Gemini] Generating engaging title and description...", flush=True)
+    if raw_metadata:
+        raw_metadata = {k: raw_metadata[k] for k in GEMINI_METADATA_KEYS if raw_metadata.get(k)}
     prompt = f"""
     Generate a fancy, engaging, and user-friendly YouTube video title and description based on the following metadata.
 
-    Metadata provided: {json.dumps(raw_metadata)}
+    Metadata provided: {orjson.dumps(raw_metadata).decode()}
     Series Name: {series_name}
     Season: {season if season else 'Unknown'}
     Episode: {episode if episode else 'Unknown'}
@@ -92,7 +187,7 @@ def generate_youtube_details(raw_metadata, series_name, season, episode):
         raw_text = response.text.strip()
         if raw_text.startswith("```json"):
             raw_text = raw_text[7:-3]
-        return json.loads(raw_text.strip())
+        return orjson.loads(raw_text.strip())
     except Exception as e:
         print(f"[Gemini] Generation failed: {e}", flush=True)
         fallback_title = f"{series_name} - S{season}E{episode}" if season else series_name
@@ -106,9 +201,66 @@ async def download_progress(current, total, filename):
         percent = 100 * (current / total)
         current_mb = current / (1024 * 1024)
         total_mb = total / (1024 * 1024)
-        print(f"[Telegram] Downloading... {percent:.1f}% ({current_mb:.1f} MB / {total_mb:.1f} MB)", flush=True)
+        print(f"[Telegram] Downloading {filename}... {percent:.1f}% ({current_mb:.1f} MB / {total_mb:.1f} MB)", flush=True)
         last_print_time[filename] = now
 
+async def parallel_download(app, message, file_path, file_size, filename):
+    """Downloads a Telegram file as several chunk ranges streamed in parallel, each written in place with os.pwrite."""
+    total_chunks = -(-file_size // TG_CHUNK_SIZE)
+    chunks_per_worker = -(-total_chunks // TG_DOWNLOAD_WORKERS)
+    progress = {"done": 0}
+    # Monotonic time before which no range should request its next chunk
+    backoff = {"until": 0.0}
+
+    async def worker(first_chunk):
+        next_chunk = first_chunk
+        end_chunk = min(first_chunk + chunks_per_worker, total_chunks)
+        retry = 0
+        while next_chunk < end_chunk:
+            resumed_at = next_chunk
+            async for chunk in app.stream_media(message, limit=end_chunk - next_chunk, offset=next_chunk):
+                os.pwrite(fd, chunk, next_chunk * TG_CHUNK_SIZE)
+                next_chunk += 1
+                # All workers share one event loop thread and there is no await between the update and the
+                # read, so a plain counter needs no lock
+                progress["done"] += len(chunk)
+                await download_progress(progress["done"], file_size, filename)
+                # Another range hit a rate limit: slow down together instead of each one tripping it again
+                wait = backoff["until"] - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            if next_chunk >= end_chunk:
+                break
+
+            # Only give up on a range that is stuck, not on one that keeps moving forward
+            retry = 1 if next_chunk > resumed_at else retry + 1
+            if retry > MAX_RANGE_RETRIES:
+                raise RuntimeError(f"Telegram stream for chunks {next_chunk}-{end_chunk - 1} made no progress after {MAX_RANGE_RETRIES} retries")
+            delay = 2 ** retry + random.random()
+            backoff["until"] = max(backoff["until"], time.monotonic() + delay)
+            print(f"[Telegram] {filename}: range stream ended at chunk {next_chunk}/{end_chunk}. Retry {retry}/{MAX_RANGE_RETRIES} in {delay:.1f}s...", flush=True)
+            await asyncio.sleep(delay)
+
+    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    tasks = []
+    try:
+        # Reserve real extents up front: the range writers then never hit holes, and a full disk fails here, not mid-download
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, file_size)
+        else:
+            os.ftruncate(fd, file_size)
+        tasks = [asyncio.create_task(worker(first)) for first in range(0, total_chunks, chunks_per_worker)]
+        await asyncio.gather(*tasks)
+        if progress["done"] != file_size:
+            raise RuntimeError(f"Telegram download incomplete: {progress['done']}/{file_size} bytes")
+    finally:
+        # Stop the remaining ranges before the shared descriptor goes away
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        os.close(fd)
+    return file_path
+
 async def download_from_telegram(post_link, app):
     """Downloads the video file from a given Telegram post link."""
     parts = post_link.rstrip('/').split('/')
@@ -124,129 +276,196 @@ async def download_from_telegram(post_link, app):
         return None
 
     print(f"[Telegram] Fetching message ID {message_id} from chat {chat_id}...", flush=True)
+    download_dir = None
     try:
         message = await app.get_messages(chat_id, message_id)
         if message and (message.video or message.document):
-            filename = getattr(message.video or message.document, 'file_name', f"video_{message_id}.mp4")
+            media = message.video or message.document
+            filename = os.path.basename(getattr(media, 'file_name', None) or f"video_{message_id}.mp4")
             print(f"[Telegram] Found file: {filename}. Starting download...", flush=True)
-            file_path = await message.download(progress=download_progress, progress_args=(filename,))
+            # One folder per post, so links processed concurrently never share a file name
+            download_dir = os.path.join(DOWNLOAD_DIR, f"{chat_id}_{message_id}")
+            os.makedirs(download_dir, exist_ok=True)
+            if media.file_size:
+                file_path = await parallel_download(app, message, os.path.join(download_dir, filename), media.file_size, filename)
+            else:
+                file_path = await message.download(
+                    file_name=os.path.join(download_dir, filename), progress=download_progress, progress_args=(filename,)
+                )
+                if not file_path:
+                    raise RuntimeError("Pyrogram returned no file")
             print(f"[Telegram] Download complete: {file_path}", flush=True)
             return file_path
         else:
             print("[Telegram] Error: Message does not contain a video or document.", flush=True)
     except Exception as e:
-         print(f"[Telegram] Failed to download: {e}", flush=True)
+        print(f"[Telegram] Failed to download: {e}", flush=True)
+        # Don't leave a full-size (preallocated) partial file on the runner's disk
+        if download_dir:
+            shutil.rmtree(download_dir, ignore_errors=True)
     return None
 
-def get_best_streams(video_path):
-    """Uses ffprobe to specifically locate the English audio and subtitle streams."""
+async def get_best_streams(video_path):
+    """Uses ffprobe to locate the English audio and subtitle streams. Also returns the audio track count."""
     cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_streams", video_path]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        streams = json.loads(result.stdout).get('streams', [])
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+        stdout, _ = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"ffprobe exited with code {process.returncode}")
+        streams = orjson.loads(stdout).get('streams', [])
     except Exception as e:
         print(f"[FFmpeg] ffprobe failed to analyze streams: {e}", flush=True)
-        return "0:a:0", None  # Fallback to the very first audio track
+        return "0:a:0", None, None  # Fallback to the very first audio track
 
+    # Single pass: count audio tracks and remember the first English audio / text subtitle track.
+    # ffmpeg's 0:a:N / 0:s:N indices are relative to each stream type, hence the per-type counters.
+    audio_count = 0
+    sub_count = 0
     audio_stream = None
     sub_stream = None
-
-    audio_streams = [s for s in streams if s['codec_type'] == 'audio']
-    sub_streams = [s for s in streams if s['codec_type'] == 'subtitle']
-
-    # Find English Audio
-    for i, s in enumerate(audio_streams):
-        lang = s.get('tags', {}).get('language', '')
-        if 'eng' in lang.lower() or 'en' in lang.lower():
-            audio_stream = f"0:a:{i}"
-            break
+    for s in streams:
+        codec_type = s.get('codec_type')
+        if codec_type not in ('audio', 'subtitle'):
+            continue
+        lang = (s.get('tags') or {}).get('language', '').lower()
+        # Muxers also write BCP 47 region tags such as 'en-US' / 'en-GB'
+        is_english = lang in ENGLISH_LANGUAGE_TAGS or lang.startswith("en-")
+        if codec_type == 'audio':
+            if is_english and audio_stream is None:
+                audio_stream = f"0:a:{audio_count}"
+            audio_count += 1
+        else:
+            if is_english and sub_stream is None and s.get('codec_name') not in IMAGE_SUBTITLE_CODECS:
+                sub_stream = f"0:s:{sub_count}"
+            sub_count += 1
 
     # Fallback to the first audio stream if English isn't found
-    if not audio_stream and audio_streams:
-        audio_stream = "0:a:0" 
-
-    # Find English Subtitles
-    for i, s in enumerate(sub_streams):
-        lang = s.get('tags', {}).get('language', '')
-        if 'eng' in lang.lower() or 'en' in lang.lower():
-            sub_stream = f"0:s:{i}"
-            break
-
-    return audio_stream, sub_stream
+    if not audio_stream and audio_count:
+        audio_stream = "0:a:0"
 
-def process_video_and_extract_subs(video_path):
-    """Removes all non-English audio tracks. Blazing fast because of -c:v copy and -c:a copy."""
-    base_name = os.path.splitext(video_path)[0]
-    # Saving as .mkv prevents format/codec mismatches when using -c copy
-    processed_video = f"{base_name}_processed.mkv"
-    sub_path = f"{base_name}_sub.srt"
+    return audio_stream, sub_stream, audio_count
 
-    print("[FFmpeg] Analyzing video streams...", flush=True)
-    audio_map, sub_map = get_best_streams(video_path)
+async def extract_subtitles(video_path, sub_map, sub_path):
+    """Extracts a single subtitle stream to SRT. Returns the SRT path, or None if nothing usable came out."""
+    print(f"[FFmpeg] Extracting English Subtitles (Stream {sub_map})...", flush=True)
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-y", "-i", video_path,
+            "-map", sub_map,
+            "-c:s", "srt", sub_path,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        returncode = await process.wait()
+    except OSError as e:
+        print(f"[FFmpeg] Subtitle extraction exception: {e}", flush=True)
+        return None
+    if returncode != 0:
+        print("[FFmpeg] Subtitle extraction failed.", flush=True)
+        return None
+    return checked_subtitle_path(sub_path)
 
-    # Extract English Subtitles if they exist
-    if sub_map:
-        print(f"[FFmpeg] Extracting English Subtitles (Stream {sub_map})...", flush=True)
-        try:
-             subprocess.run([
-                 "ffmpeg", "-y", "-i", video_path, 
-                 "-map", sub_map, 
-                 "-c:s", "srt", sub_path
-             ], check=True, capture_output=True)
-             if not os.path.exists(sub_path) or os.path.getsize(sub_path) == 0:
-                 sub_path = None
-             else:
-                 print("[FFmpeg] Subtitles extracted successfully.", flush=True)
-        except subprocess.CalledProcessError:
-             print("[FFmpeg] Subtitle extraction failed.", flush=True)
-             sub_path = None
-    else:
-        print("[FFmpeg] No English subtitle track found in the file.", flush=True)
-        sub_path = None
+def checked_subtitle_path(sub_path):
+    """Returns sub_path if FFmpeg actually wrote subtitles to it, otherwise None."""
+    if not os.path.exists(sub_path) or os.path.getsize(sub_path) == 0:
+        return None
+    print("[FFmpeg] Subtitles extracted successfully.", flush=True)
+    return sub_path
 
-    # Process Video: Keep video and the selected audio, DO NOT RE-ENCODE.
-    print(f"[FFmpeg] Processing video (Isolating Audio Stream: {audio_map})...", flush=True)
+async def run_ffmpeg_copy(cmd, label):
+    """Runs an FFmpeg stream-copy command, printing throttled progress. Returns True if FFmpeg succeeded."""
     try:
-        # We copy both video and audio streams. This takes seconds rather than minutes.
-        process = subprocess.Popen(
-            [
-                "ffmpeg", "-y", "-i", video_path,
-                "-map", "0:v:0",                 
-                "-map", audio_map, 
-                "-c:v", "copy",                  
-                "-c:a", "copy",  # SPEED HACK: direct copy, zero re-encoding!                 
-                processed_video
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
         )
 
+        error_tail = collections.deque(maxlen=20)  # Last error lines, for the failure message
         last_ffmpeg_print = 0
-        for line in process.stdout:
-            # Look for the time=... output in FFmpeg to show progress
-            if "time=" in line:
+        async for raw_line in process.stderr:
+            line = raw_line.decode(errors='replace').strip()
+            key, sep, _ = line.partition('=')
+            if not (sep and key.isidentifier()):
+                # Not a -progress key=value line, so it is an FFmpeg error/warning
+                error_tail.append(line)
+            elif key == "out_time":
                 now = time.time()
                 # Print progress every 10 seconds to avoid GitHub log spam
                 if now - last_ffmpeg_print > 10.0:
-                    time_match = re.search(r"time=(\d{2}:\d{2}:\d{2})", line)
+                    time_match = FFMPEG_TIME_RE.search(line)
                     if time_match:
-                        print(f"[FFmpeg] Progress: Copied up to timestamp {time_match.group(1)}", flush=True)
+                        print(f"[FFmpeg] {label}: Copied up to timestamp {time_match.group(1)}", flush=True)
                         last_ffmpeg_print = now
 
-        process.wait()
+        await process.wait()
         if process.returncode != 0:
-            print("[FFmpeg] Video processing failed. Falling back to original video.", flush=True)
-            return video_path, sub_path
+            print(f"[FFmpeg] {label}: FFmpeg exited with code {process.returncode}:", flush=True)
+            for line in error_tail:
+                print(f"[FFmpeg]   {line}", flush=True)
+            return False
+        return True
+    except Exception as e:
+        print(f"[FFmpeg] {label}: video processing exception: {e}", flush=True)
+        return False
 
+async def process_video_and_extract_subs(video_path):
+    """Removes all non-English audio tracks and extracts English subtitles in a single FFmpeg pass (-c copy, no re-encode)."""
+    base_name = os.path.splitext(video_path)[0]
+    # Saving as .mkv prevents format/codec mismatches when using -c copy
+    processed_video = f"{base_name}_processed.mkv"
+    sub_path = f"{base_name}_sub.srt"
+    label = os.path.basename(video_path)
+
+    print("[FFmpeg] Analyzing video streams...", flush=True)
+    audio_map, sub_map, audio_count = await get_best_streams(video_path)
+    if not sub_map:
+        print("[FFmpeg] No English subtitle track found in the file.", flush=True)
+
+    # Nothing to strip: a single audio track means the remux would just rewrite the same file
+    if audio_count is not None and audio_count <= 1:
+        print("[FFmpeg] Only one audio track found. Skipping remux, uploading the original file.", flush=True)
+        return video_path, (await extract_subtitles(video_path, sub_map, sub_path)) if sub_map else None
+
+    # Process Video: Keep video and the selected audio, DO NOT RE-ENCODE.
+    # We copy both video and audio streams. This takes seconds rather than minutes.
+    print(f"[FFmpeg] Processing video (Isolating Audio Stream: {audio_map})...", flush=True)
+    remux_cmd = [
+        # Only errors and machine-readable progress go to stderr, so nothing piles up in memory
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-progress", "pipe:2",
+        "-y", "-i", video_path,
+        "-map", "0:v:0",
+        "-map", audio_map,
+        "-c:v", "copy",
+        "-c:a", "copy",  # SPEED HACK: direct copy, zero re-encoding!
+        processed_video
+    ]
+    if sub_map:
+        # The subtitle track is written as a second output of the same command, so the file is only read once
+        print(f"[FFmpeg] Extracting English Subtitles (Stream {sub_map}) in the same pass...", flush=True)
+        if await run_ffmpeg_copy(remux_cmd + ["-map", sub_map, "-c:s", "srt", sub_path], label):
+            print("[FFmpeg] Video processing complete. Kept original quality, blazing fast.", flush=True)
+            return processed_video, checked_subtitle_path(sub_path)
+        # A subtitle track FFmpeg cannot convert fails the whole run; it must not cost us the audio isolation
+        print("[FFmpeg] Combined run failed. Retrying the audio remux without subtitles...", flush=True)
+
+    if await run_ffmpeg_copy(remux_cmd, label):
         print("[FFmpeg] Video processing complete. Kept original quality, blazing fast.", flush=True)
-        return processed_video, sub_path
-    except Exception as e:
-        print(f"[FFmpeg] Video processing exception: {e}. Falling back to original video.", flush=True)
-        return video_path, sub_path
+        return processed_video, (await extract_subtitles(video_path, sub_map, sub_path)) if sub_map else None
+
+    print("[FFmpeg] Video processing failed. Falling back to original video.", flush=True)
+    return video_path, (await extract_subtitles(video_path, sub_map, sub_path)) if sub_map else None
 
 def get_or_create_playlist(youtube, series_title):
     """Finds an existing playlist for the series, or creates a new one."""
+    cache_key = series_title.lower()
+    if cache_key in playlist_cache:
+        print(f"[YouTube] Reusing playlist for '{series_title}' (ID: {playlist_cache[cache_key]}).", flush=True)
+        return playlist_cache[cache_key]
+
     print(f"[YouTube] Checking for existing playlist: '{series_title}'...", flush=True)
     try:
         request = youtube.playlists().list(part="snippet", mine=True, maxResults=50)
@@ -254,8 +473,9 @@ def get_or_create_playlist(youtube, series_title):
 
         # Search existing
         for item in response.get('items', []):
-            if item['snippet']['title'].lower() == series_title.lower():
+            if item['snippet']['title'].lower() == cache_key:
                 print(f"[YouTube] Found existing playlist (ID: {item['id']}).", flush=True)
+                playlist_cache[cache_key] = item['id']
                 return item['id']
 
         # Create new
@@ -272,6 +492,7 @@ def get_or_create_playlist(youtube, series_title):
         request = youtube.playlists().insert(part="snippet,status", body=body)
         response = request.execute()
         print(f"[YouTube] Created new playlist! (ID: {response['id']})", flush=True)
+        playlist_cache[cache_key] = response['id']
         return response['id']
     except Exception as e:
         print(f"[YouTube] Failed to manage playlist: {e}", flush=True)
@@ -295,7 +516,7 @@ def add_video_to_playlist(youtube, video_id, playlist_id):
     except Exception as e:
         print(f"[YouTube] Failed to add video to playlist: {e}", flush=True)
 
-def upload_to_youtube(youtube, file_path, title, description, category_id="22"):
+def upload_to_youtube(youtube, file_path, title, description, chunk_size, category_id="22"):
     """Uploads a video file to YouTube as a private video with progress tracking."""
     print(f"[YouTube] Preparing to upload video: {title}", flush=True)
     body = {
@@ -309,18 +530,40 @@ def upload_to_youtube(youtube, file_path, title, description, category_id="22"):
         }
     }
 
-    # SUPERCHARGED UPLOAD: Changed chunk size from 5MB to 100MB
-    chunk_size = 100 * 1024 * 1024 
+    # SUPERCHARGED UPLOAD: 100MB chunks by default, tunable via YOUTUBE_UPLOAD_CHUNK_MB (-1 = whole file)
     media = MediaFileUpload(file_path, chunksize=chunk_size, resumable=True)
+    label = os.path.basename(file_path)
 
     try:
         request = youtube.videos().insert(part=','.join(body.keys()), body=body, media_body=media)
         response = None
 
+        retry = 0
+        last_logged_pct = -5
         while response is None:
-            status, response = request.next_chunk()
-            if status:
-                print(f"[YouTube] Uploading... {int(status.progress() * 100)}%", flush=True)
+            try:
+                status, response = request.next_chunk()
+            except HttpError as e:
+                if e.resp.status not in RETRIABLE_STATUS_CODES or retry >= MAX_UPLOAD_RETRIES:
+                    raise
+                error = f"HTTP {e.resp.status}"
+            except RETRIABLE_EXCEPTIONS as e:
+                if retry >= MAX_UPLOAD_RETRIES:
+                    raise
+                error = e
+            else:
+                retry = 0
+                # Only log in steps of 5% or more to keep the Actions log readable
+                if status and int(status.progress() * 100) - last_logged_pct >= 5:
+                    last_logged_pct = int(status.progress() * 100)
+                    print(f"[YouTube] Uploading {label}... {last_logged_pct}%", flush=True)
+                continue
+
+            # Resumable upload: the next call resumes from the last byte YouTube acknowledged
+            retry += 1
+            delay = 2 ** retry + random.random()
+            print(f"[YouTube] {label}: chunk upload failed ({error}). Retry {retry}/{MAX_UPLOAD_RETRIES} in {delay:.1f}s...", flush=True)
+            time.sleep(delay)
 
         print(f"[YouTube] Upload complete! Video ID: {response['id']}", flush=True)
         return response['id']
@@ -329,25 +572,31 @@ def upload_to_youtube(youtube, file_path, title, description, category_id="22"):
         return None
 
 def upload_caption_to_youtube(youtube, video_id, caption_path):
-    """Uploads a subtitle file as a caption track."""
-    print(f"[YouTube] Uploading English Subtitles (CC) to video {video_id}...", flush=True)
-    body = {
-        'snippet': {
-            'videoId': video_id,
-            'language': 'en',
-            'name': 'English',
-            'isDraft': False
-        }
-    }
-    media = MediaFileUpload(caption_path, mimetype='text/plain', chunksize=-1, resumable=True)
+    """Uploads a subtitle file as a caption track. Near-empty files are skipped to save an API call and quota."""
     try:
+        with open(caption_path, 'rb') as f:
+            cue_count = f.read().count(b'-->')
+        if cue_count < MIN_SUBTITLE_CUES:
+            print(f"[YouTube] Subtitle file has only {cue_count} cue(s). Skipping caption upload.", flush=True)
+            return
+
+        print(f"[YouTube] Uploading English Subtitles (CC) to video {video_id}...", flush=True)
+        body = {
+            'snippet': {
+                'videoId': video_id,
+                'language': 'en',
+                'name': 'English',
+                'isDraft': False
+            }
+        }
+        media = MediaFileUpload(caption_path, mimetype='text/plain', chunksize=-1, resumable=True)
         request = youtube.captions().insert(part='snippet', body=body, media_body=media)
         request.execute()
         print("[YouTube] Subtitles uploaded successfully!", flush=True)
     except Exception as e:
         print(f"[YouTube] Failed to upload subtitles: {e}", flush=True)
 
-async def process_single_link(link, app, youtube):
+async def process_single_link(link, app, youtube, youtube_lock, upload_chunk_size):
     print("\n" + "="*50, flush=True)
     print(f"[SYSTEM] Starting Process for Link: {link}", flush=True)
     print("="*50, flush=True)
@@ -357,64 +606,101 @@ async def process_single_link(link, app, youtube):
         print("[SYSTEM] Skipping link due to download failure.", flush=True)
         return
 
-    # 1. Process Video (Audio isolation & Subtitles)
-    processed_video_path, sub_path = process_video_and_extract_subs(video_path)
-
-    # 2. Get Metadata
     filename = os.path.basename(video_path)
     season, episode = extract_season_episode(filename)
-    raw_meta, series_name = fetch_movie_metadata(filename)
-
-    # 3. Generate Fancy Data
-    yt_details = generate_youtube_details(raw_meta, series_name, season, episode)
-
-    # 4. Upload to YouTube
-    main_video_id = upload_to_youtube(youtube, processed_video_path, yt_details['title'], yt_details['description'])
-
-    if main_video_id:
-        # 5. Upload Subtitles
-        if sub_path:
-            upload_caption_to_youtube(youtube, main_video_id, sub_path)
 
-        # 6. Add to Playlist (Only if it's a series)
-        if season and series_name:
-            playlist_id = get_or_create_playlist(youtube, series_name)
-            if playlist_id:
-                add_video_to_playlist(youtube, main_video_id, playlist_id)
-
-    # Clean up local files to save disk space on the GitHub runner
-    print(f"[SYSTEM] Cleaning up temporary files for {filename}...", flush=True)
+    # 1. Get Metadata & Generate Fancy Data (network-bound, runs in the background)
+    metadata_task = asyncio.create_task(asyncio.to_thread(build_youtube_details, filename, season, episode))
     try:
-        os.remove(video_path)
-        if processed_video_path != video_path:
-            os.remove(processed_video_path)
-        if sub_path:
-            os.remove(sub_path)
+        # 2. Process Video (Audio isolation & Subtitles) while the metadata requests are in flight
+        processed_video_path, sub_path = await process_video_and_extract_subs(video_path)
+        yt_details, series_name = await metadata_task
+
+        # The YouTube client (httplib2) is not thread-safe, so only one link talks to YouTube at a time.
+        # Other links keep downloading and remuxing in the meantime.
+        async with youtube_lock:
+            # 3. Upload to YouTube
+            # The chunked upload blocks for minutes; keep it off the event loop so the Telegram client stays responsive
+            main_video_id = await asyncio.to_thread(
+                upload_to_youtube, youtube, processed_video_path, yt_details['title'], yt_details['description'],
+                upload_chunk_size
+            )
+
+            if main_video_id:
+                # 4. Upload Subtitles
+                if sub_path:
+                    await asyncio.to_thread(upload_caption_to_youtube, youtube, main_video_id, sub_path)
+
+                # 5. Add to Playlist (Only if it's a series)
+                if season and series_name:
+                    playlist_id = await asyncio.to_thread(get_or_create_playlist, youtube, series_name)
+                    if playlist_id:
+                        await asyncio.to_thread(add_video_to_playlist, youtube, main_video_id, playlist_id)
+    finally:
+        # A failed remux must not leave the metadata task running (or its result unretrieved) for a dead link
+        metadata_task.cancel()
+        await asyncio.gather(metadata_task, return_exceptions=True)
+
+        # Clean up local files to save disk space on the GitHub runner, even if a stage raised.
+        # The whole per-post folder goes, including partial remux output and rejected subtitle files.
+        print(f"[SYSTEM] Cleaning up temporary files for {filename}...", flush=True)
+        shutil.rmtree(os.path.dirname(video_path), ignore_errors=True)
         print("[SYSTEM] Cleanup finished.", flush=True)
-    except OSError as e:
-        print(f"[SYSTEM] Cleanup error: {e}", flush=True)
 
 async def main():
     if not TG_POST_LINKS_ENV:
         print("[SYSTEM] No Telegram links provided. Exiting.", flush=True)
         return
 
+    # Unset GitHub secrets arrive as empty strings, so test for a value rather than key presence
+    missing = [var for var in REQUIRED_ENV_VARS if not os.environ.get(var)]
+    if missing:
+        print(f"[SYSTEM] Missing required environment variables: {', '.join(missing)}. Exiting.", flush=True)
+        return
+
+    try:
+        upload_chunk_mb = int(YT_UPLOAD_CHUNK_MB_ENV or 100)
+    except ValueError:
+        print(f"[SYSTEM] YOUTUBE_UPLOAD_CHUNK_MB must be a whole number of MB, got '{YT_UPLOAD_CHUNK_MB_ENV}'. Exiting.", flush=True)
+        return
+    upload_chunk_size = upload_chunk_mb * 1024 * 1024 if upload_chunk_mb > 0 else -1
+
     # Clean up user input (handles comma-separated and multiline inputs)
     links = [link.strip() for link in TG_POST_LINKS_ENV.replace(',', '\n').split('\n') if link.strip()]
+    # Links run concurrently in per-post folders, so a repeated link would clobber and delete its twin's files
+    links = list(dict.fromkeys(links))
 
     print(f"[SYSTEM] Found {len(links)} link(s) to process.", flush=True)
 
     youtube = get_youtube_service()
-    app = Client("my_bot", api_id=TG_API_ID, api_hash=TG_API_HASH, bot_token=TG_BOT_TOKEN, in_memory=True)
+    app = Client(
+        "my_bot", api_id=TG_API_ID, api_hash=TG_API_HASH, bot_token=TG_BOT_TOKEN, in_memory=True,
+        no_updates=True,  # We only fetch and download; skip the update dispatcher entirely
+        # Waits out short FloodWaits on get_messages and other plain API calls. Downloads are not covered:
+        # Pyrogram's get_file passes its own sleep_threshold=30 to GetFile, so parallel_download backs off itself
+        sleep_threshold=60,
+        # Pyrogram allows a single transfer at a time by default
+        max_concurrent_transmissions=TG_DOWNLOAD_WORKERS * MAX_CONCURRENT_LINKS
+    )
+
+    # Bounded so at most a few videos sit on the runner's disk at once
+    link_slots = asyncio.Semaphore(MAX_CONCURRENT_LINKS)
+    youtube_lock = asyncio.Lock()
+
+    async def run_link(link):
+        async with link_slots:
+            await process_single_link(link, app, youtube, youtube_lock, upload_chunk_size)
 
     async with app:
-        for link in links:
-            await process_single_link(link, app, youtube)
+        results = await asyncio.gather(*(run_link(link) for link in links), return_exceptions=True)
+
+    for link, result in zip(links, results):
+        if isinstance(result, Exception):
+            print(f"[SYSTEM] Link failed with an unexpected error: {link} ({result})", flush=True)
 
     print("\n" + "="*50, flush=True)
     print("[SYSTEM] All tasks completed successfully!", flush=True)
     print("="*50, flush=True)
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
@@ -0,0 +1,36 @@
+import unittest
+
+from main import clean_title_from_filename, extract_season_episode
+
+
+class CleanTitleTest(unittest.TestCase):
+    def test_release_name(self):
+        self.assertEqual(clean_title_from_filename("Show.Name.S01E02.1080p.WEB-DL.mkv"), "Show Name")
+
+    def test_leading_release_group_tags(self):
+        self.assertEqual(clean_title_from_filename("[Group] Show Name - S01E02 [1080p].mkv"), "Show Name")
+        self.assertEqual(clean_title_from_filename("[Group][1080p] (Raws) Show Name - S01E02.mkv"), "Show Name")
+
+    def test_title_starting_with_year(self):
+        self.assertEqual(clean_title_from_filename("1917.2019.1080p.BluRay.x264.mkv"), "1917")
+
+    def test_episode_tag_glued_to_title(self):
+        self.assertEqual(clean_title_from_filename("ShowS01E02.mkv"), "Show")
+
+
+class SeasonEpisodeTest(unittest.TestCase):
+    def test_zero_padded(self):
+        self.assertEqual(extract_season_episode("Show.s1e2.mkv"), ("01", "02"))
+
+    def test_double_digit_season(self):
+        self.assertEqual(extract_season_episode("Show.S12E05.mkv"), ("12", "05"))
+
+    def test_episode_tag_glued_to_title(self):
+        self.assertEqual(extract_season_episode("ShowS01E02.mkv"), ("01", "02"))
+
+    def test_no_episode(self):
+        self.assertEqual(extract_season_episode("Movie.2019.1080p.mkv"), (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()